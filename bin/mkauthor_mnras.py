@@ -2,12 +2,26 @@
 
 import argparse
 import csv
-import itertools
+import functools
 import logging
+import re
 import sys
-import unicodedata
 
-logger = logging.getLogger()
+logger = logging.getLogger(__name__)
+
+_ORCID_RE = re.compile(r'\d{4}-\d{4}-\d{4}-\d{3}[\dX]', re.ASCII)
+_AFFIL_SPLIT_RE = re.compile(r'\s*;\s*', re.ASCII)
+
+
+@functools.lru_cache(maxsize=None)
+def _norm(s):
+    s = s.strip()
+    # ASCII strings are already in NFKC.
+    if s.isascii():
+        return sys.intern(s)
+    # Imported lazily since ASCII-only inputs never need the Unicode tables.
+    import unicodedata
+    return sys.intern(unicodedata.normalize('NFKC', s))
 
 
 class AuthorList:
@@ -23,24 +37,23 @@ class AuthorList:
 
     @staticmethod
     def _normalize(s):
-        return unicodedata.normalize('NFKC', s.strip())
+        return _norm(s)
 
     def add_author_entry(self, name, affiliations, notes=None, email=None, orcid_id=None):
         normalized_name = self._normalize(name)
         if normalized_name in self.author_dict:
             raise ValueError(f'Duplicate author name "{normalized_name}"')
-        affil_indices = []
+        affil_indices = [0] * len(affiliations)
         if not affiliations:
             logger.warning('Empty affiliation list for author "%s"', normalized_name)
-        for affil in affiliations:
+        for k, affil in enumerate(affiliations):
             normalized_affil = self._normalize(affil)
-            if normalized_affil in self.affil_dict:
-                affil_indices.append(self.affil_dict[normalized_affil])
-            else:
-                self.affil_dict[normalized_affil] = self.affil_index
-                affil_indices.append(self.affil_index)
+            index = self.affil_dict.get(normalized_affil)
+            if index is None:
+                index = self.affil_dict[normalized_affil] = self.affil_index
                 self.affil_index += 1
-        self.author_dict[normalized_name] = affil_indices
+            affil_indices[k] = index
+        self.author_dict[normalized_name] = ','.join(map(str, affil_indices))
         if notes:
             self.notes_dict[normalized_name] = notes
         if email:
@@ -51,37 +64,66 @@ class AuthorList:
             self.orcid_dict[normalized_name] = orcid_id
 
     @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def texify_author_name(name):
         word_list = name.split()
         return '~'.join(word_list)
 
     @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def texify_affiliation_entry(notemark, affiliation):
         return f'$^{{{notemark}}}${affiliation} \\\\'
 
+    @staticmethod
+    def texify_orcid_mark(orcid_id, orcid_logo):
+        return ('%\n\\textsuperscript{'
+                f'\\href{{https://orcid.org/{orcid_id}}}'
+                '{\\includegraphics[width=2.5mm]'
+                f'{{{orcid_logo}}}'
+                '}}%\n')
+
+    def texify_author_affils(self, author, indices):
+        parts = ['\\textsuperscript{', indices, '}']
+        if author in self.notes_dict:
+            parts.append('%\n')
+            parts.append('\n'.join(
+                '\\thanks{{{}}}'.format(n) for n in self.notes_dict[author]))
+        return ''.join(parts)
+
     def format_author_list(self, with_orcid=False, orcid_logo=None):
-        lines = []
-        last_author = len(self.author_dict) - 1
-        for i, (author, indices) in enumerate(self.author_dict.items()):
-            latex_author = self.texify_author_name(author)
-            if with_orcid and author in self.orcid_dict:
-                orcid_id = self.orcid_dict[author]
-                latex_author += ('%\n\\textsuperscript{'
-                                 f'\href{{https://orcid.org/{orcid_id}}}'
-                                 '{\\includegraphics[width=2.5mm]'
-                                 f'{{{orcid_logo}}}'
-                                 '}}%\n')
-            latex_affils = '\\textsuperscript{{{}}}'.format(','.join(map(str, indices)))
-            if author in self.notes_dict:
-                author_notes = '\n'.join(
-                    '\\thanks{{{}}}'.format(n) for n in self.notes_dict[author])
-                latex_affils = '{}%\n{}'.format(latex_affils, author_notes)
-            if i < last_author - 1:
-                lines.append(f'{latex_author},{latex_affils}')
-            else:
-                lines.append(f'{latex_author}\\thinspace{latex_affils}')
-                if i < last_author:
-                    lines.append('and')
+        if with_orcid:
+            # Bind everything that is fixed for this call once, so the
+            # per-author closure only does a single dict lookup.
+            texify_name = self.texify_author_name
+            orcid_dict = {}
+            for author, orcid_id in self.orcid_dict.items():
+                # The checksum digit may be written as a lowercase x.
+                normalized_id = orcid_id[:-1] + orcid_id[-1:].upper()
+                if _ORCID_RE.fullmatch(normalized_id):
+                    orcid_id = normalized_id
+                else:
+                    logger.warning('Invalid ORCID iD "%s" for author "%s"', orcid_id, author)
+                orcid_dict[author] = orcid_id
+            texify_orcid_mark = functools.partial(
+                self.texify_orcid_mark, orcid_logo=orcid_logo)
+
+            def texify_author(author):
+                orcid_id = orcid_dict.get(author)
+                if orcid_id is None:
+                    return texify_name(author)
+                return texify_name(author) + texify_orcid_mark(orcid_id)
+        else:
+            texify_author = self.texify_author_name
+        texify_affils = self.texify_author_affils
+        items = list(self.author_dict.items())
+        lines = [f'{texify_author(author)},{texify_affils(author, indices)}'
+                 for author, indices in items[:-2]]
+        # The last two authors are joined by "and" instead of a comma.
+        tail = [f'{texify_author(author)}\\thinspace{texify_affils(author, indices)}'
+                for author, indices in items[-2:]]
+        if len(tail) == 2:
+            tail.insert(1, 'and')
+        lines.extend(tail)
         lines.append(r'\\')
         return lines
 
@@ -92,13 +134,18 @@ class AuthorList:
         return email_list
 
     def format_affiliation_list(self):
-        return [self.texify_affiliation_entry(str(i), affil)
-                for affil, i in self.affil_dict.items()]
+        # affil_dict assigns consecutive indices in insertion order.
+        return [self.texify_affiliation_entry(i, affil)
+                for i, affil in enumerate(self.affil_dict, start=1)]
+
+    def iter_latex(self, with_orcid=False, orcid_logo=None):
+        yield from self.format_author_list(with_orcid=with_orcid, orcid_logo=orcid_logo)
+        yield from self.format_affiliation_list()
 
     def output_latex(self, with_orcid=False, orcid_logo=None):
         author_lines = self.format_author_list(with_orcid=with_orcid, orcid_logo=orcid_logo)
         affil_lines = self.format_affiliation_list()
-        latex_macro = '\n'.join(itertools.chain(author_lines, affil_lines))
+        latex_macro = '\n'.join(author_lines + affil_lines)
         return latex_macro
 
     def output_email_addr(self):
@@ -107,33 +154,35 @@ class AuthorList:
 
 
 def read_csv(f, args):
-    header = f.readline()
-    columns = {c.lower(): i for i, c in enumerate(header.strip().split(','))}
-    reader = csv.reader(sys.stdin)
+    reader = csv.reader(f)
+    header = next(reader)
+    columns = {c.strip().lower(): i for i, c in enumerate(header)}
+    name_col = columns['name']
+    affil_cols = [columns[f'affiliation {i + 1}'] for i in range(args.max_affil)]
+    note_cols = [columns[f'note {i + 1}'] for i in range(args.max_note)]
+    orcid_col = columns['orcid']
+    email_col = columns['email']
     author_entries = []
     for row in reader:
+        row = [c.strip() for c in row]
         author_entry = {}
-        if author_name := row[columns['name']].strip():
-            author_entry['name'] = author_name
+        if row[name_col]:
+            author_entry['name'] = row[name_col]
         else:
             continue
-        affil_list = []
-        for i in range(args.max_affil):
-            affil_col = 'affiliation {}'.format(i + 1)
-            if affil := row[columns[affil_col]].strip():
-                affil_list.append(affil)
+        if args.split_affil:
+            affil_list = [a for i in affil_cols if row[i]
+                          for a in _AFFIL_SPLIT_RE.split(row[i]) if a]
+        else:
+            affil_list = [row[i] for i in affil_cols if row[i]]
         author_entry['affiliations'] = affil_list
-        note_list = []
-        for i in range(args.max_note):
-            note_col = 'note {}'.format(i + 1)
-            if note := row[columns[note_col]].strip():
-                note_list.append(note)
+        note_list = [row[i] for i in note_cols if row[i]]
         if note_list:
             author_entry['notes'] = note_list
-        if orcid_id := row[columns['orcid']].strip():
-            author_entry['orcid_id'] = orcid_id
-        if email := row[columns['email']].strip():
-            author_entry['email'] = email
+        if row[orcid_col]:
+            author_entry['orcid_id'] = row[orcid_col]
+        if row[email_col]:
+            author_entry['email'] = row[email_col]
         author_entries.append(author_entry)
     return author_entries
 
@@ -152,6 +201,9 @@ def parse_args():
     parser.add_argument(
         '--max-note', type=int, default=1, metavar='N',
         help='Maximum number of columns for author notes in the CSV file.')
+    parser.add_argument(
+        '--split-affil', action='store_true',
+        help='Split affiliation cells on semicolons into separate affiliations.')
     parser.add_argument(
         '--with-orcid', action='store_true',
         help='Output ORCID iDs.')
@@ -171,9 +223,10 @@ def main():
     if args.emails:
         print(author_list.output_email_addr())
         return
-    print(author_list.output_latex(
-        with_orcid=args.with_orcid,
-        orcid_logo=args.orcid_logo))
+    sys.stdout.writelines(
+        line + '\n' for line in author_list.iter_latex(
+            with_orcid=args.with_orcid,
+            orcid_logo=args.orcid_logo))
 
 
 